@@ -1,14 +1,15 @@
-import calendar
 import os
 from datetime import date
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 import db as dbmod
 from auth import resolve_role, verify_login
 from excel_io import export_parte_to_excel, import_maestro_general
+from periodos import month_bounds, month_dates_iso
 
 
 st.set_page_config(page_title="APP de guardias", page_icon="🗓️", layout="wide")
@@ -23,12 +24,38 @@ def cfg(key: str, default=None):
     return default
 
 
+def _parse_leaders(leaders) -> frozenset:
+    if not leaders:
+        return frozenset()
+    # Streamlit secrets puede devolver list nativa o string; normalizamos
+    if isinstance(leaders, str):
+        # si lo ponen como "5478,5483,..." en ENV
+        return frozenset(x.strip() for x in leaders.split(",") if x.strip())
+    return frozenset(str(x).strip() for x in leaders)
+
+
 ADMIN_PASSWORD = cfg("ADMIN_PASSWORD", "")
 LEADER_LEGAJOS = cfg("LEADER_LEGAJOS", None)  # lista o None
+LEADER_SET = _parse_leaders(LEADER_LEGAJOS)
 DB_BACKEND = cfg("DB_BACKEND", "postgres")
 
+
+# Al editar secrets.toml Streamlit recarga el mismo objeto st.secrets y re-ejecuta:
+# descartar la config cacheada en db para que coincida con lo que lee cfg()
+st.secrets.file_change_listener.connect(dbmod.clear_config_cache)
+
+
+@st.cache_resource
+def _migrate_once() -> bool:
+    # Una vez por proceso; SKIP_MIGRATE=1 si el esquema se gestiona por fuera
+    if str(cfg("SKIP_MIGRATE", "")).strip() == "1":
+        return False
+    dbmod.migrate(st.secrets)
+    return True
+
+
 # Migrar al inicio
-dbmod.migrate(st.secrets)
+_migrate_once()
 
 
 TIPOS_DIA = ["G", "F", "D", "HO"]
@@ -39,20 +66,10 @@ def yyyymm_from_year_month(y: int, m: int) -> str:
     return f"{y:04d}{m:02d}"
 
 
-def month_bounds(y: int, m: int) -> Tuple[date, date]:
-    last_day = calendar.monthrange(y, m)[1]
-    return date(y, m, 1), date(y, m, last_day)
-
-
-def month_dates(y: int, m: int) -> List[date]:
-    start, end = month_bounds(y, m)
-    return [date(y, m, d) for d in range(1, end.day + 1)]
-
-
 def init_session():
     st.session_state.setdefault("user", None)
     st.session_state.setdefault("role", None)
-    st.session_state.setdefault("leaders", [])
+    st.session_state.setdefault("leaders", frozenset())
     st.session_state.setdefault("admin_ok", False)
     st.session_state.setdefault("msg", "")
 
@@ -68,20 +85,27 @@ def show_message():
         st.session_state["msg"] = ""
 
 
+@st.cache_data(ttl=60)
+def _cached_personal() -> Dict[str, List]:
+    # Columnar: {"legajo": [...], "nombre": [...], ...}
+    return dbmod.list_personal(st.secrets)
+
+
+@st.cache_data(ttl=60)
+def _cached_person(legajo: str) -> Optional[Dict]:
+    r = dbmod.get_person_by_legajo(st.secrets, legajo)
+    return dict(r) if r else None
+
+
+@st.cache_data(ttl=300)
 def resolve_leaders() -> List[str]:
-    leaders = cfg("LEADER_LEGAJOS", None)
-    if leaders:
-        # Streamlit secrets puede devolver list nativa o string; normalizamos
-        if isinstance(leaders, str):
-            # si lo ponen como "5478,5483,..." en ENV
-            parts = [x.strip() for x in leaders.split(",") if x.strip()]
-            return parts
-        return [str(x).strip() for x in leaders]
+    if LEADER_SET:
+        return sorted(LEADER_SET)
     return dbmod.leader_set_in_db(st.secrets)
 
 
 def ensure_user_loaded():
-    st.session_state["leaders"] = resolve_leaders()
+    st.session_state["leaders"] = frozenset(resolve_leaders())
 
 
 def logout():
@@ -90,9 +114,9 @@ def logout():
     set_message("Sesión cerrada.")
 
 
+@st.cache_data
 def build_month_df(y: int, m: int) -> pd.DataFrame:
-    dates = month_dates(y, m)
-    df = pd.DataFrame({"Fecha": [d.isoformat() for d in dates]})
+    df = pd.DataFrame({"Fecha": list(month_dates_iso(y, m))})
     for t in TIPOS_DIA:
         df[t] = False
     df["HV"] = 0.0
@@ -101,76 +125,108 @@ def build_month_df(y: int, m: int) -> pd.DataFrame:
     return df
 
 
-def items_to_month_df(items_rows, y: int, m: int) -> pd.DataFrame:
-    df = build_month_df(y, m)
-    if not items_rows:
-        return df
-
-    by_date = {}
-    for r in items_rows:
-        f = r["fecha"]
-        by_date.setdefault(f, []).append(r)
-
-    for i, row in df.iterrows():
-        f = row["Fecha"]
-        lst = by_date.get(f, [])
-        flags = {t: False for t in TIPOS_DIA}
-        hv = 0.0
-        he = 0.0
-        comentario = ""
-        for it in lst:
-            tipo = it["tipo"]
-            if tipo in TIPOS_DIA:
-                flags[tipo] = True
-            elif tipo == "HV":
-                hv += float(it["valor_num"] or 0.0)
-            elif tipo == "HE":
-                he += float(it["valor_num"] or 0.0)
-            if it.get("comentario") and not comentario:
-                comentario = it["comentario"]
-
-        for t in TIPOS_DIA:
-            df.loc[i, t] = bool(flags[t])
-        df.loc[i, "HV"] = float(hv)
-        df.loc[i, "HE"] = float(he)
-        df.loc[i, "Comentario"] = comentario
-
-    return df
+def items_to_month_df(items_cols, y: int, m: int) -> pd.DataFrame:
+    if len(items_cols["fecha"]) == 0:
+        return build_month_df(y, m)
+
+    fechas = month_dates_iso(y, m)
+    date_idx = {f: i for i, f in enumerate(fechas)}
+    tipo_idx = {t: i for i, t in enumerate([*TIPOS_DIA, "HV", "HE"])}
+    n_dias = len(TIPOS_DIA)
+
+    rows = np.fromiter((date_idx.get(f, -1) for f in items_cols["fecha"]), dtype=np.intp)
+    cols = np.fromiter((tipo_idx.get(t, -1) for t in items_cols["tipo"]), dtype=np.intp)
+    valid = (rows >= 0) & (cols >= 0)
+
+    # Flags G/F/D/HO: OR por (día, tipo); HV/HE: suma por (día, tipo)
+    flags = np.zeros((len(fechas), n_dias), dtype=bool)
+    es_dia = valid & (cols < n_dias)
+    np.logical_or.at(flags, (rows[es_dia], cols[es_dia]), True)
+
+    horas = np.zeros((len(fechas), 2), dtype=float)
+    es_hora = valid & (cols >= n_dias)
+    valor_num = np.nan_to_num(np.array(items_cols["valor_num"], dtype=float))
+    np.add.at(horas, (rows[es_hora], cols[es_hora] - n_dias), valor_num[es_hora])
+
+    # Primer comentario no vacío del día (los items vienen ordenados por fecha, tipo)
+    com = np.array(items_cols["comentario"], dtype=object)
+    tiene_com = valid & np.not_equal(com, None) & np.not_equal(com, "")
+    comentario = np.full(len(fechas), "", dtype=object)
+    dias_com, primero = np.unique(rows[tiene_com], return_index=True)
+    comentario[dias_com] = com[tiene_com][primero]
+
+    data = {"Fecha": list(fechas)}
+    for i, t in enumerate(TIPOS_DIA):
+        data[t] = flags[:, i]
+    data["HV"] = horas[:, 0]
+    data["HE"] = horas[:, 1]
+    data["Comentario"] = comentario
+    return pd.DataFrame(data)
+
+
+@st.cache_data(ttl=60)
+def _load_grid(legajo: str, y: int, m: int, submitted_at: Optional[str] = None) -> pd.DataFrame:
+    # Se invalida explícitamente en save_month_df_as_items (sólo en este proceso).
+    # submitted_at cambia en cada envío: forma parte de la clave para que otras
+    # instancias no sirvan la grilla de un envío anterior.
+    start, end = month_bounds(y, m)
+    items = dbmod.list_items_for_period(st.secrets, legajo, start.isoformat(), end.isoformat())
+    return items_to_month_df(items, y, m)
+
+
+@st.cache_data(max_entries=32)
+def _excel_bytes(person_nombre: str, legajo: str, periodo_yyyymm: str, df_mes: pd.DataFrame, totales: Dict) -> bytes:
+    return export_parte_to_excel(
+        person_nombre=person_nombre,
+        legajo=legajo,
+        periodo_yyyymm=periodo_yyyymm,
+        df_mes=df_mes,
+        totales=totales,
+    )
 
 
 def compute_totals(df: pd.DataFrame) -> Dict:
-    totals = {}
-    for t in TIPOS_DIA:
-        totals[t] = int(df[t].fillna(False).astype(bool).sum())
-    totals["HV"] = float(pd.to_numeric(df["HV"], errors="coerce").fillna(0).sum())
-    totals["HE"] = float(pd.to_numeric(df["HE"], errors="coerce").fillna(0).sum())
+    flags = df[TIPOS_DIA].to_numpy(dtype=bool, na_value=False)
+    totals = dict(zip(TIPOS_DIA, flags.sum(axis=0).tolist()))
+    horas = df[["HV", "HE"]].apply(pd.to_numeric, errors="coerce").fillna(0.0).sum()
+    totals["HV"] = float(horas["HV"])
+    totals["HE"] = float(horas["HE"])
     return totals
 
 
-def save_month_df_as_items(legajo: str, y: int, m: int, df: pd.DataFrame):
-    fechas = df["Fecha"].tolist()
-    dbmod.delete_items_for_dates(st.secrets, legajo, fechas)
-
-    items = []
-    for _, r in df.iterrows():
-        f = str(r["Fecha"])
-        comentario = (r.get("Comentario") or "").strip() or None
+ITEM_COLS = ["legajo", "fecha", "tipo", "valor_text", "valor_num", "comentario"]
 
-        for t in TIPOS_DIA:
-            if bool(r.get(t, False)):
-                items.append(
-                    {"legajo": legajo, "fecha": f, "tipo": t, "valor_text": "1", "valor_num": None, "comentario": comentario}
-                )
 
-        hv = float(pd.to_numeric(r.get("HV", 0), errors="coerce") or 0.0)
-        he = float(pd.to_numeric(r.get("HE", 0), errors="coerce") or 0.0)
+def save_month_df_as_items(legajo: str, y: int, m: int, df: pd.DataFrame):
+    legajo = str(legajo).strip()
+    fechas = df["Fecha"].tolist()
 
-        if hv > 0:
-            items.append({"legajo": legajo, "fecha": f, "tipo": "HV", "valor_text": None, "valor_num": hv, "comentario": comentario})
-        if he > 0:
-            items.append({"legajo": legajo, "fecha": f, "tipo": "HE", "valor_text": None, "valor_num": he, "comentario": comentario})
+    df2 = df.copy()
+    df2["Fecha"] = df2["Fecha"].astype(str)
+    df2[TIPOS_DIA] = df2[TIPOS_DIA].fillna(False).astype(bool)
+    df2[["HV", "HE"]] = df2[["HV", "HE"]].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    com = df2["Comentario"].fillna("").astype(str).str.strip()
+    df2["Comentario"] = com.mask(com.eq(""))
+
+    # Formato largo: una fila por (fecha, tipo) marcada / con horas > 0
+    flags_long = df2.melt(id_vars=["Fecha", "Comentario"], value_vars=TIPOS_DIA, var_name="tipo", value_name="v")
+    flags_long = flags_long[flags_long["v"]].drop(columns="v").assign(valor_text="1")
+    nums_long = df2.melt(id_vars=["Fecha", "Comentario"], value_vars=["HV", "HE"], var_name="tipo", value_name="valor_num")
+    nums_long = nums_long[nums_long["valor_num"] > 0]
+
+    long_df = (
+        pd.concat([flags_long, nums_long], ignore_index=True)
+        .rename(columns={"Fecha": "fecha", "Comentario": "comentario"})
+        .assign(legajo=legajo)
+        .reindex(columns=ITEM_COLS)
+    )
+    # NaN -> None (y escalares numpy -> Python) para el driver de la DB;
+    # las columnas ya están normalizadas, las tuplas salen directo en orden ITEM_COLS
+    long_df = long_df.astype(object).where(long_df.notna(), None)
+    rows = list(long_df.itertuples(index=False, name=None))
 
-    dbmod.insert_items(st.secrets, items)
+    dbmod.replace_items_for_period(st.secrets, legajo, fechas, rows)
+    _load_grid.clear()
 
 
 def can_edit(estado: str) -> bool:
@@ -227,28 +283,33 @@ def page_admin():
                         st.info(f"Se omitieron {len(warnings) - 200} advertencias adicionales.")
 
             # Validación leader_legajo en set de líderes si existe config
-            leaders_cfg = cfg("LEADER_LEGAJOS", None)
-            leader_set = None
-            if leaders_cfg:
-                if isinstance(leaders_cfg, str):
-                    leader_set = set([x.strip() for x in leaders_cfg.split(",") if x.strip()])
-                else:
-                    leader_set = set(map(str, leaders_cfg))
-
-            invalid = []
-            for r in rows:
-                ll = str(r.get("leader_legajo", "")).strip()
-                if not ll:
-                    invalid.append((r.get("legajo"), "leader_legajo vacío"))
-                elif leader_set is not None and ll not in leader_set:
-                    invalid.append((r.get("legajo"), f"leader_legajo {ll} no pertenece a LEADER_LEGAJOS"))
-            if invalid:
+            leader_set = LEADER_SET or None
+
+            df_rows = pd.DataFrame(rows, columns=["legajo", "leader_legajo"])
+            ll = df_rows["leader_legajo"].fillna("").astype(str).str.strip()
+            mask_empty = ll.eq("")
+            mask_notin = ~mask_empty & ~ll.isin(leader_set) if leader_set is not None else pd.Series(False, index=ll.index)
+            mask_invalid = mask_empty | mask_notin
+            if mask_invalid.any():
+                invalid_df = pd.DataFrame(
+                    {
+                        "Legajo": df_rows.loc[mask_invalid, "legajo"],
+                        "Problema": np.where(
+                            mask_empty[mask_invalid],
+                            "leader_legajo vacío",
+                            "leader_legajo " + ll[mask_invalid] + " no pertenece a LEADER_LEGAJOS",
+                        ),
+                    }
+                )
                 st.error("Hay registros con líder inválido. Corregí el maestro o LEADER_LEGAJOS.")
-                st.dataframe(pd.DataFrame(invalid, columns=["Legajo", "Problema"]), use_container_width=True, hide_index=True)
+                st.dataframe(invalid_df, use_container_width=True, hide_index=True)
                 return
 
             if st.button("✅ Importar / Actualizar personal", type="primary"):
                 ins, upd = dbmod.upsert_personal_rows(st.secrets, rows)
+                _cached_personal.clear()
+                _cached_person.clear()
+                resolve_leaders.clear()
                 st.success(f"Import OK. Insertados: {ins} | Actualizados: {upd}")
                 st.rerun()
 
@@ -257,8 +318,8 @@ def page_admin():
 
     st.divider()
     st.subheader("Personal cargado")
-    people = dbmod.list_personal(st.secrets)
-    if not people:
+    people = _cached_personal()
+    if not people["legajo"]:
         st.info("Todavía no hay personal cargado.")
         return
     st.dataframe(pd.DataFrame(people), use_container_width=True, hide_index=True)
@@ -268,7 +329,7 @@ def page_login():
     st.title("🧾 APP de guardias — Login")
     st.caption("Ingresá con **Legajo + CUIL** (completo o últimos 4).")
 
-    if not dbmod.list_personal(st.secrets):
+    if not _cached_personal()["legajo"]:
         st.warning("No hay personal cargado aún. Pedí al admin que importe el maestro.")
         return
 
@@ -313,13 +374,16 @@ def page_empleado():
     elif estado == "RECHAZADO":
         st.warning(f"Parte rechazado ❌ — Comentario: {parte.get('rejection_comment') or '(sin comentario)'}")
 
-    start, end = month_bounds(y, m)
-    items = dbmod.list_items_for_period(st.secrets, user["legajo"], start.isoformat(), end.isoformat())
-    df = items_to_month_df(items, y, m)
+    df = _load_grid(user["legajo"], y, m, parte.get("submitted_at"))
 
     editable = can_edit(estado)
     st.subheader("Grilla del mes")
+    _editor_fragment(user, y, m, periodo, df, editable)
 
+
+@st.fragment
+def _editor_fragment(user: Dict, y: int, m: int, periodo: str, df: pd.DataFrame, editable: bool):
+    # Los toggles del editor sólo re-ejecutan este bloque, no la carga del parte/items
     edited = st.data_editor(
         df,
         use_container_width=True,
@@ -362,19 +426,27 @@ def page_empleado():
 
     st.divider()
     st.subheader("Exportar a Excel")
-    excel_bytes = export_parte_to_excel(
-        person_nombre=user["nombre"],
-        legajo=user["legajo"],
-        periodo_yyyymm=periodo,
-        df_mes=edited,
-        totales=tot,
-    )
-    st.download_button(
-        "⬇️ Descargar Excel",
-        data=excel_bytes,
-        file_name=f"parte_{user['legajo']}_{periodo}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+    # El xlsx se arma recién cuando el usuario lo pide (y se cachea por contenido).
+    # El flag guarda el hash de la grilla preparada: si se edita, hay que volver a prepararlo.
+    excel_key = f"excel_listo_{user['legajo']}_{periodo}"
+    grid_hash = int(pd.util.hash_pandas_object(edited, index=False).sum())
+    if st.session_state.get(excel_key) != grid_hash:
+        if st.button("📄 Preparar Excel"):
+            st.session_state[excel_key] = grid_hash
+    if st.session_state.get(excel_key) == grid_hash:
+        excel_bytes = _excel_bytes(
+            person_nombre=user["nombre"],
+            legajo=user["legajo"],
+            periodo_yyyymm=periodo,
+            df_mes=edited,
+            totales=tot,
+        )
+        st.download_button(
+            "⬇️ Descargar Excel",
+            data=excel_bytes,
+            file_name=f"parte_{user['legajo']}_{periodo}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
 
 
 def page_lider():
@@ -392,25 +464,29 @@ def page_lider():
     st.dataframe(dfp, use_container_width=True, hide_index=True)
 
     st.divider()
+    _detalle_parte_fragment(user, pendientes)
+
+
+@st.fragment
+def _detalle_parte_fragment(user: Dict, pendientes: List[Dict]):
+    # Cambiar la selección no vuelve a consultar la bandeja de pendientes
     st.subheader("Abrir parte")
     options = [f"{r['legajo']} | {r['nombre']} | {r['periodo_yyyymm']}" for r in pendientes]
     choice = st.selectbox("Seleccioná", options=options)
     legajo_sel = choice.split("|")[0].strip()
     periodo_sel = choice.split("|")[-1].strip()
 
-    per = dbmod.get_person_by_legajo(st.secrets, legajo_sel)
+    per = _cached_person(legajo_sel)
     if not per or str(per["leader_legajo"]).strip() != str(user["legajo"]).strip():
         st.error("No tenés permisos para ver este parte.")
         return
 
     y = int(periodo_sel[:4])
     m = int(periodo_sel[4:6])
-    start, end = month_bounds(y, m)
-    items = dbmod.list_items_for_period(st.secrets, legajo_sel, start.isoformat(), end.isoformat())
-    df = items_to_month_df(items, y, m)
+    parte = dbmod.get_parte(st.secrets, legajo_sel, periodo_sel)
+    df = _load_grid(legajo_sel, y, m, parte["submitted_at"])
     tot = compute_totals(df)
 
-    parte = dbmod.get_parte(st.secrets, legajo_sel, periodo_sel)
     st.write(f"Empleado: **{per['nombre']}** — Estado: **{parte['estado']}** — Enviado: {parte.get('submitted_at') or '-'}")
 
     st.subheader("Detalle (solo lectura)")
@@ -419,6 +495,11 @@ def page_lider():
     st.subheader("Totales")
     ui_totals(tot)
 
+    _acciones_lider_fragment(user, legajo_sel, periodo_sel)
+
+
+@st.fragment
+def _acciones_lider_fragment(user: Dict, legajo_sel: str, periodo_sel: str):
     st.divider()
     c1, c2, _ = st.columns([1, 1, 2])
 
@@ -456,7 +537,9 @@ def page_lider():
 
 def main():
     init_session()
-    ensure_user_loaded()
+    # Sin sesión no hace falta resolver líderes (el login lo hace al autenticar)
+    if st.session_state["user"]:
+        ensure_user_loaded()
 
     with st.sidebar:
         st.header("🧭 Navegación")
@@ -1,11 +1,16 @@
+import functools
 import re
-from typing import Dict, Optional, Tuple, List
+from typing import AbstractSet, Dict, Optional, Tuple
 
 from db import get_person_by_legajo
 
 
+_NONDIGIT = re.compile(r"\D+")
+
+
+@functools.lru_cache(maxsize=1024)
 def normalize_digits(s: str) -> str:
-    return re.sub(r"\D+", "", (s or "").strip())
+    return _NONDIGIT.sub("", (s or "").strip())
 
 
 def verify_login(secrets, legajo_input: str, cuil_input: str) -> Tuple[bool, Optional[Dict], str]:
@@ -24,7 +29,7 @@ def verify_login(secrets, legajo_input: str, cuil_input: str) -> Tuple[bool, Opt
         return False, None, "Ingresá CUIL (completo) o últimos 4."
 
     if len(cuil_in) <= 4:
-        if cuil_db[-len(cuil_in):] != cuil_in:
+        if not cuil_db.endswith(cuil_in):
             return False, None, "CUIL no coincide (últimos dígitos incorrectos)."
     else:
         if cuil_db != cuil_in:
@@ -38,5 +43,5 @@ def verify_login(secrets, legajo_input: str, cuil_input: str) -> Tuple[bool, Opt
     return True, user, ""
 
 
-def resolve_role(user_legajo: str, leaders: List[str]) -> str:
-    return "lider" if str(user_legajo).strip() in set(map(str, leaders)) else "empleado"
+def resolve_role(user_legajo: str, leaders: AbstractSet[str]) -> str:
+    return "lider" if str(user_legajo).strip() in leaders else "empleado"
@@ -1,14 +1,83 @@
+import io
 import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 
 ISO_DT = "%Y-%m-%d %H:%M:%S"
 
+# Pool de conexiones Postgres (uno por proceso y por set de parámetros).
+# psycopg2 sólo retiene minconn conexiones libres y cierra el resto al devolverlas:
+# MINCONN es la cantidad que queda abierta para reutilizar entre llamadas.
+# Ojo: ThreadedConnectionPool.__init__ abre las MINCONN conexiones de entrada,
+# en cada proceso, al crear el pool (primer get_conn).
+PG_POOL_MINCONN = 5
+PG_POOL_MAXCONN = 10
+PG_POOL_RECYCLE_S = 300
+
+_pg_pools: Dict[Tuple, psycopg2.pool.ThreadedConnectionPool] = {}
+_pg_pools_lock = threading.Lock()
+_pg_last_used: Dict[int, float] = {}
+
+# PRAGMAs SQLite al abrir cada conexión (journal_mode=WAL es persistente: una vez por archivo)
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+)
+
+_sqlite_wal_paths = set()
+# Una conexión SQLite por thread y por archivo, reutilizada entre llamadas
+_sqlite_local = threading.local()
+
+_config_cache: Dict[Tuple[str, int], Tuple[Any, Any]] = {}
+
+
+def _copy_value(v: Any) -> str:
+    # Formato text de COPY: NULL = \N y escapes de backslash/tab/newline
+    if v is None:
+        return "\\N"
+    return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class _CopyStream(io.TextIOBase):
+    """
+    Archivo de sólo lectura para cursor.copy_expert que genera las líneas de
+    COPY (formato text) a demanda, sin armar el buffer completo en memoria.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[Any, ...]]):
+        self._lines = ("\t".join(map(_copy_value, r)) + "\n" for r in rows)
+        self._buf = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        chunks = [self._buf]
+        n = len(self._buf)
+        while size < 0 or n < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            n += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            self._buf = ""
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
 
 def utcnow_str() -> str:
     return datetime.utcnow().strftime(ISO_DT)
@@ -23,15 +92,38 @@ def get_setting(key: str, secrets: Any = None, default: Optional[str] = None) ->
     return default
 
 
+def _cached_setting(name: str, secrets: Any, build) -> Any:
+    # Config resuelta una vez por objeto secrets (st.secrets no es hasheable: clave id()).
+    # Guardamos la referencia para que el id no se reutilice mientras vive la entrada.
+    key = (name, id(secrets))
+    hit = _config_cache.get(key)
+    if hit is not None and hit[0] is secrets:
+        return hit[1]
+    value = build(secrets)
+    _config_cache[key] = (secrets, value)
+    return value
+
+
+def clear_config_cache(*_: Any) -> None:
+    # Forzar relectura de ENV/secrets (p. ej. tras cambiar variables en caliente).
+    # Acepta args para poder conectarse como receptor de st.secrets.file_change_listener.
+    _config_cache.clear()
+    _leader_cache.clear()
+
+
 def get_db_backend(secrets=None) -> str:
-    return (get_setting("DB_BACKEND", secrets, "postgres") or "postgres").strip().lower()
+    return _cached_setting(
+        "backend",
+        secrets,
+        lambda s: (get_setting("DB_BACKEND", s, "postgres") or "postgres").strip().lower(),
+    )
 
 
 def get_sqlite_path(secrets=None) -> str:
-    return get_setting("DB_PATH", secrets, "data/app.db") or "data/app.db"
+    return _cached_setting("sqlite_path", secrets, lambda s: get_setting("DB_PATH", s, "data/app.db") or "data/app.db")
 
 
-def pg_conn_params(secrets=None) -> Dict[str, Any]:
+def _pg_conn_params(secrets=None) -> Dict[str, Any]:
     # Cloud Run + Cloud SQL: DB_HOST suele ser /cloudsql/INSTANCE_CONNECTION_NAME
     host = get_setting("DB_HOST", secrets, None)
     port = int(get_setting("DB_PORT", secrets, "5432") or "5432")
@@ -50,27 +142,124 @@ def pg_conn_params(secrets=None) -> Dict[str, Any]:
     return params
 
 
+def pg_conn_params(secrets=None) -> Dict[str, Any]:
+    # Copia: el dict cacheado no debe mutarse desde afuera
+    return dict(_cached_setting("pg_params", secrets, _pg_conn_params))
+
+
+def _pg_pool(params: Dict[str, Any]) -> psycopg2.pool.ThreadedConnectionPool:
+    key = tuple(sorted(params.items()))
+    pool = _pg_pools.get(key)
+    if pool is None:
+        with _pg_pools_lock:
+            pool = _pg_pools.get(key)
+            if pool is None:
+                pool = psycopg2.pool.ThreadedConnectionPool(PG_POOL_MINCONN, PG_POOL_MAXCONN, **params)
+                _pg_pools[key] = pool
+    return pool
+
+
+def _pg_getconn(pool: psycopg2.pool.ThreadedConnectionPool):
+    # Descartamos conexiones cerradas o inactivas hace mucho (timeouts de Cloud SQL).
+    # El pool entrega LIFO: puede haber varias vencidas seguidas, así que se repite
+    # hasta obtener una válida (al vaciarse, getconn abre una conexión nueva).
+    while True:
+        conn = pool.getconn()
+        last = _pg_last_used.pop(id(conn), None)
+        if not conn.closed and (last is None or time.monotonic() - last <= PG_POOL_RECYCLE_S):
+            return conn
+        pool.putconn(conn, close=True)
+
+
+def _sqlite_conn(path: str) -> sqlite3.Connection:
+    conns = getattr(_sqlite_local, "conns", None)
+    if conns is None:
+        conns = _sqlite_local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if path not in _sqlite_wal_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            _sqlite_wal_paths.add(path)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        conns[path] = conn
+    return conn
+
+
+def _sqlite_begin_immediate(conn: sqlite3.Connection) -> None:
+    # Escrituras en bloque: tomar el lock de escritura al inicio (BEGIN IMMEDIATE)
+    # en vez de escalar desde una transacción diferida; con busy_timeout los
+    # escritores concurrentes esperan en lugar de fallar con SQLITE_BUSY.
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
 @contextmanager
 def get_conn(secrets=None):
     backend = get_db_backend(secrets)
     if backend == "sqlite":
-        path = get_sqlite_path(secrets)
-        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-        conn = sqlite3.connect(path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+        conn = _sqlite_conn(get_sqlite_path(secrets))
         try:
             yield ("sqlite", conn)
             conn.commit()
-        finally:
-            conn.close()
+        except Exception:
+            # La conexión se reutiliza: no dejar la transacción a medias
+            conn.rollback()
+            raise
     else:
         params = pg_conn_params(secrets)
-        conn = psycopg2.connect(**params)
+        pool = _pg_pool(params)
+        try:
+            conn = _pg_getconn(pool)
+        except psycopg2.pool.PoolError:
+            # Pool agotado: conexión directa, se cierra al salir
+            pool = None
+            conn = psycopg2.connect(**params)
         try:
             yield ("postgres", conn)
             conn.commit()
         finally:
-            conn.close()
+            if pool is None:
+                conn.close()
+            else:
+                # putconn hace rollback si quedó una transacción abierta.
+                # Se registra antes de devolverla (otro thread puede tomarla enseguida)
+                # y se descarta si el pool la cerró por exceder minconn.
+                if not conn.closed:
+                    _pg_last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn, close=bool(conn.closed))
+                if conn.closed:
+                    _pg_last_used.pop(id(conn), None)
+
+
+def _migrate_sqlite_items_fecha(conn) -> None:
+    # Tablas creadas con fecha TEXT ('YYYY-MM-DD'): reconstruir con fecha INTEGER (YYYYMMDD)
+    cols = {r["name"]: r["type"] for r in conn.execute("PRAGMA table_info(items)")}
+    if str(cols.get("fecha", "")).upper() != "TEXT":
+        return
+    conn.executescript(
+        """
+        BEGIN;
+        CREATE TABLE items_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            legajo TEXT NOT NULL,
+            fecha INTEGER NOT NULL,
+            tipo TEXT NOT NULL CHECK(tipo IN ('G','F','D','HO','HV','HE')),
+            valor_text TEXT,
+            valor_num REAL,
+            comentario TEXT
+        );
+        INSERT INTO items_new (id, legajo, fecha, tipo, valor_text, valor_num, comentario)
+            SELECT id, legajo, CAST(replace(fecha, '-', '') AS INTEGER), tipo, valor_text, valor_num, comentario
+            FROM items;
+        DROP TABLE items;
+        ALTER TABLE items_new RENAME TO items;
+        COMMIT;
+        """
+    )
 
 
 def migrate(secrets=None) -> None:
@@ -112,7 +301,7 @@ def migrate(secrets=None) -> None:
                 CREATE TABLE IF NOT EXISTS items (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     legajo TEXT NOT NULL,
-                    fecha TEXT NOT NULL,
+                    fecha INTEGER NOT NULL,
                     tipo TEXT NOT NULL CHECK(tipo IN ('G','F','D','HO','HV','HE')),
                     valor_text TEXT,
                     valor_num REAL,
@@ -120,9 +309,13 @@ def migrate(secrets=None) -> None:
                 )
                 """
             )
+            _migrate_sqlite_items_fecha(conn)
             conn.execute("CREATE INDEX IF NOT EXISTS idx_items_legajo_fecha ON items(legajo, fecha)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_partes_estado ON partes(estado)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_partes_legajo_periodo ON partes(legajo, periodo_yyyymm)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_personal_leader ON personal(leader_legajo)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_partes_estado_submitted ON partes(estado, submitted_at DESC)")
+            # (estado) es prefijo del índice compuesto: redundante, sólo suma costo de escritura
+            conn.execute("DROP INDEX IF EXISTS idx_partes_estado")
         return
 
     # Postgres
@@ -162,7 +355,7 @@ def migrate(secrets=None) -> None:
             CREATE TABLE IF NOT EXISTS items (
                 id BIGSERIAL PRIMARY KEY,
                 legajo TEXT NOT NULL,
-                fecha TEXT NOT NULL,
+                fecha DATE NOT NULL,
                 tipo TEXT NOT NULL CHECK (tipo IN ('G','F','D','HO','HV','HE')),
                 valor_text TEXT,
                 valor_num DOUBLE PRECISION,
@@ -170,92 +363,151 @@ def migrate(secrets=None) -> None:
             );
             """
         )
+        # Tablas creadas con fecha TEXT: pasar a DATE
+        cur.execute(
+            """
+            SELECT data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'items' AND column_name = 'fecha'
+            """
+        )
+        r = cur.fetchone()
+        if r and r[0] == "text":
+            cur.execute("ALTER TABLE items ALTER COLUMN fecha TYPE date USING fecha::date;")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_items_legajo_fecha ON items(legajo, fecha);")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_partes_estado ON partes(estado);")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_partes_legajo_periodo ON partes(legajo, periodo_yyyymm);")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_personal_leader ON personal(leader_legajo);")
+        # Índice parcial: sólo la cola de pendientes (ENVIADO), ya ordenada para la bandeja
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_partes_enviado_submitted ON partes(submitted_at DESC NULLS LAST) WHERE estado = 'ENVIADO';"
+        )
         cur.close()
 
 
+def _as_columns(cols: Tuple[str, ...], rows) -> Dict[str, List[Any]]:
+    # Filas -> columnas (struct-of-arrays)
+    if not rows:
+        return {c: [] for c in cols}
+    return {c: list(v) for c, v in zip(cols, zip(*rows))}
+
+
 # ---------- Personal ----------
 
+PERSONAL_UPSERT_PAGE_SIZE = 500
+
+_PERSONAL_ON_CONFLICT = """
+    ON CONFLICT (legajo) DO UPDATE SET
+        cuil=EXCLUDED.cuil,
+        nombre=EXCLUDED.nombre,
+        leader_legajo=EXCLUDED.leader_legajo,
+        funcion=EXCLUDED.funcion,
+        origen=EXCLUDED.origen,
+        lugar_trabajo=EXCLUDED.lugar_trabajo,
+        extra_json=EXCLUDED.extra_json
+    RETURNING (xmax = 0)
+"""
+
+
+def _personal_tuples(rows: List[Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+    # Un mismo INSERT ... ON CONFLICT no puede tocar dos veces el mismo legajo:
+    # deduplicamos y gana la última fila (igual que el upsert fila a fila).
+    by_legajo: Dict[str, Tuple[Any, ...]] = {}
+    for r in rows:
+        legajo = str(r["legajo"]).strip()
+        by_legajo[legajo] = (
+            legajo,
+            str(r["cuil"]).strip(),
+            str(r["nombre"]).strip(),
+            str(r["leader_legajo"]).strip(),
+            r.get("funcion"),
+            r.get("origen"),
+            r.get("lugar_trabajo"),
+            r.get("extra_json"),
+        )
+    return list(by_legajo.values())
+
+
 def upsert_personal_rows(secrets, rows: List[Dict[str, Any]]) -> Tuple[int, int]:
-    inserted = 0
-    updated = 0
+    try:
+        return _upsert_personal_rows(secrets, rows)
+    finally:
+        # Invalidar después del commit: la próxima lectura ve los líderes nuevos
+        _leader_cache.clear()
 
+
+def _upsert_personal_rows(secrets, rows: List[Dict[str, Any]]) -> Tuple[int, int]:
     backend = get_db_backend(secrets)
     with get_conn(secrets) as (_, conn):
         if backend == "sqlite":
-            for r in rows:
-                legajo = str(r["legajo"]).strip()
-                cur = conn.execute("SELECT legajo FROM personal WHERE legajo = ?", (legajo,))
-                exists = cur.fetchone() is not None
-
-                conn.execute(
-                    """
-                    INSERT INTO personal (legajo, cuil, nombre, leader_legajo, funcion, origen, lugar_trabajo, extra_json)
-                    VALUES (?,?,?,?,?,?,?,?)
-                    ON CONFLICT(legajo) DO UPDATE SET
-                        cuil=excluded.cuil,
-                        nombre=excluded.nombre,
-                        leader_legajo=excluded.leader_legajo,
-                        funcion=excluded.funcion,
-                        origen=excluded.origen,
-                        lugar_trabajo=excluded.lugar_trabajo,
-                        extra_json=excluded.extra_json
-                    """,
-                    (
-                        legajo,
-                        str(r["cuil"]).strip(),
-                        str(r["nombre"]).strip(),
-                        str(r["leader_legajo"]).strip(),
-                        r.get("funcion"),
-                        r.get("origen"),
-                        r.get("lugar_trabajo"),
-                        r.get("extra_json"),
-                    ),
-                )
-                updated += 1 if exists else 0
-                inserted += 0 if exists else 1
+            _sqlite_begin_immediate(conn)
+            # Sin SELECT por fila: insertados = crecimiento de la tabla
+            antes = conn.execute("SELECT COUNT(*) FROM personal").fetchone()[0]
+            conn.executemany(
+                """
+                INSERT INTO personal (legajo, cuil, nombre, leader_legajo, funcion, origen, lugar_trabajo, extra_json)
+                VALUES (?,?,?,?,?,?,?,?)
+                ON CONFLICT(legajo) DO UPDATE SET
+                    cuil=excluded.cuil,
+                    nombre=excluded.nombre,
+                    leader_legajo=excluded.leader_legajo,
+                    funcion=excluded.funcion,
+                    origen=excluded.origen,
+                    lugar_trabajo=excluded.lugar_trabajo,
+                    extra_json=excluded.extra_json
+                """,
+                _personal_tuples(rows),
+            )
+            despues = conn.execute("SELECT COUNT(*) FROM personal").fetchone()[0]
+            inserted = despues - antes
+            updated = len(rows) - inserted
             return inserted, updated
 
-        # Postgres
+        # Postgres: todo en la misma transacción; RETURNING (xmax = 0) es true para filas insertadas.
+        row_tuples = _personal_tuples(rows)
         cur = conn.cursor()
-        for r in rows:
-            legajo = str(r["legajo"]).strip()
-            cur.execute("SELECT legajo FROM personal WHERE legajo=%s", (legajo,))
-            exists = cur.fetchone() is not None
-
-            cur.execute(
-                """
+        if len(row_tuples) <= PERSONAL_UPSERT_PAGE_SIZE:
+            # Import chico: un único INSERT multi-VALUES
+            results = psycopg2.extras.execute_values(
+                cur,
+                f"""
                 INSERT INTO personal (legajo, cuil, nombre, leader_legajo, funcion, origen, lugar_trabajo, extra_json)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-                ON CONFLICT (legajo) DO UPDATE SET
-                    cuil=EXCLUDED.cuil,
-                    nombre=EXCLUDED.nombre,
-                    leader_legajo=EXCLUDED.leader_legajo,
-                    funcion=EXCLUDED.funcion,
-                    origen=EXCLUDED.origen,
-                    lugar_trabajo=EXCLUDED.lugar_trabajo,
-                    extra_json=EXCLUDED.extra_json
+                VALUES %s
+                {_PERSONAL_ON_CONFLICT}
                 """,
-                (
-                    legajo,
-                    str(r["cuil"]).strip(),
-                    str(r["nombre"]).strip(),
-                    str(r["leader_legajo"]).strip(),
-                    r.get("funcion"),
-                    r.get("origen"),
-                    r.get("lugar_trabajo"),
-                    r.get("extra_json"),
-                ),
+                row_tuples,
+                page_size=PERSONAL_UPSERT_PAGE_SIZE,
+                fetch=True,
             )
-            updated += 1 if exists else 0
-            inserted += 0 if exists else 1
+        else:
+            # Import grande: COPY a una tabla temporal y un único INSERT ... SELECT
+            cur.execute("CREATE TEMP TABLE personal_staging (LIKE personal) ON COMMIT DROP")
+            cur.copy_expert(
+                "COPY personal_staging (legajo, cuil, nombre, leader_legajo, funcion, origen, lugar_trabajo, extra_json) FROM STDIN",
+                _CopyStream(row_tuples),
+            )
+            cur.execute(
+                f"""
+                INSERT INTO personal (legajo, cuil, nombre, leader_legajo, funcion, origen, lugar_trabajo, extra_json)
+                SELECT legajo, cuil, nombre, leader_legajo, funcion, origen, lugar_trabajo, extra_json
+                FROM personal_staging
+                {_PERSONAL_ON_CONFLICT}
+                """
+            )
+            results = cur.fetchall()
         cur.close()
+        inserted = sum(1 for (was_inserted,) in results if was_inserted)
+        updated = len(rows) - inserted
         return inserted, updated
 
 
-def list_personal(secrets) -> List[Dict[str, Any]]:
+PERSONAL_LIST_COLS = ("legajo", "cuil", "nombre", "leader_legajo", "funcion", "origen", "lugar_trabajo")
+
+
+def list_personal(secrets) -> Dict[str, List[Any]]:
+    """
+    Devuelve el personal ordenado por nombre en formato columnar:
+    {"legajo": [...], "cuil": [...], "nombre": [...], ...}
+    """
     backend = get_db_backend(secrets)
     with get_conn(secrets) as (_, conn):
         if backend == "sqlite":
@@ -266,9 +518,9 @@ def list_personal(secrets) -> List[Dict[str, Any]]:
                 ORDER BY nombre
                 """
             )
-            return [dict(r) for r in cur.fetchall()]
+            return _as_columns(PERSONAL_LIST_COLS, cur.fetchall())
 
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur = conn.cursor()
         cur.execute(
             """
             SELECT legajo, cuil, nombre, leader_legajo, funcion, origen, lugar_trabajo
@@ -278,7 +530,7 @@ def list_personal(secrets) -> List[Dict[str, Any]]:
         )
         rows = cur.fetchall()
         cur.close()
-        return rows
+        return _as_columns(PERSONAL_LIST_COLS, rows)
 
 
 def get_person_by_legajo(secrets, legajo: str) -> Optional[Dict[str, Any]]:
@@ -309,7 +561,13 @@ def get_person_by_legajo(secrets, legajo: str) -> Optional[Dict[str, Any]]:
         return r
 
 
-def leader_set_in_db(secrets) -> List[str]:
+LEADER_CACHE_TTL_S = 60
+
+# id(secrets) -> (secrets, momento de carga, líderes); se invalida al importar personal
+_leader_cache: Dict[int, Tuple[Any, float, List[str]]] = {}
+
+
+def _leader_set_query(secrets) -> List[str]:
     backend = get_db_backend(secrets)
     with get_conn(secrets) as (_, conn):
         if backend == "sqlite":
@@ -327,8 +585,23 @@ def leader_set_in_db(secrets) -> List[str]:
         return sorted([str(r[0]).strip() for r in rows])
 
 
+def leader_set_in_db(secrets) -> List[str]:
+    # El set de líderes solo cambia al reimportar el maestro: cache con TTL
+    now = time.monotonic()
+    hit = _leader_cache.get(id(secrets))
+    if hit is not None and hit[0] is secrets and now - hit[1] < LEADER_CACHE_TTL_S:
+        return list(hit[2])
+    leaders = _leader_set_query(secrets)
+    _leader_cache[id(secrets)] = (secrets, now, leaders)
+    return list(leaders)
+
+
 # ---------- Partes ----------
 
+# Columnas explícitas: no depender del orden/columnas agregadas a la tabla
+PARTE_COLS = "id, legajo, periodo_yyyymm, estado, submitted_at, approved_at, approved_by_legajo, rejection_comment"
+
+
 def get_or_create_parte(secrets, legajo: str, periodo_yyyymm: str) -> Dict[str, Any]:
     legajo = str(legajo).strip()
     periodo_yyyymm = str(periodo_yyyymm).strip()
@@ -345,46 +618,49 @@ def get_or_create_parte(secrets, legajo: str, periodo_yyyymm: str) -> Dict[str,
                 (legajo, periodo_yyyymm),
             )
             cur = conn.execute(
-                "SELECT * FROM partes WHERE legajo = ? AND periodo_yyyymm = ?",
+                f"SELECT {PARTE_COLS} FROM partes WHERE legajo = ? AND periodo_yyyymm = ?",
                 (legajo, periodo_yyyymm),
             )
             return dict(cur.fetchone())
 
+        # INSERT + SELECT en un solo envío (un round-trip); el cursor queda con
+        # el resultado del último statement.
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cur.execute(
-            """
+            f"""
             INSERT INTO partes (legajo, periodo_yyyymm, estado)
-            VALUES (%s, %s, 'BORRADOR')
-            ON CONFLICT (legajo, periodo_yyyymm) DO NOTHING
+            VALUES (%(legajo)s, %(periodo)s, 'BORRADOR')
+            ON CONFLICT (legajo, periodo_yyyymm) DO NOTHING;
+            SELECT {PARTE_COLS} FROM partes WHERE legajo=%(legajo)s AND periodo_yyyymm=%(periodo)s;
             """,
-            (legajo, periodo_yyyymm),
-        )
-        cur.execute(
-            "SELECT * FROM partes WHERE legajo=%s AND periodo_yyyymm=%s",
-            (legajo, periodo_yyyymm),
+            {"legajo": legajo, "periodo": periodo_yyyymm},
         )
         r = cur.fetchone()
         cur.close()
         return r
 
 
-def update_parte_estado(
-    secrets,
-    legajo: str,
-    periodo_yyyymm: str,
-    nuevo_estado: str,
-    submitted_at: Optional[str] = None,
-    approved_at: Optional[str] = None,
-    approved_by_legajo: Optional[str] = None,
-    rejection_comment: Optional[str] = None,
-) -> None:
-    legajo = str(legajo).strip()
-    periodo_yyyymm = str(periodo_yyyymm).strip()
+# (legajo, periodo_yyyymm, estado, submitted_at, approved_at, approved_by_legajo, rejection_comment)
+ParteUpdate = Tuple[str, str, str, Optional[str], Optional[str], Optional[str], Optional[str]]
+
+
+def bulk_update_parte_estado(secrets, updates: List[ParteUpdate]) -> None:
+    """
+    Actualiza el estado de varios partes en un solo statement.
+    Los timestamps / aprobador en None conservan el valor actual (COALESCE);
+    rejection_comment se pisa siempre, igual que en update_parte_estado.
+    """
+    rows = [
+        (str(legajo).strip(), str(periodo).strip(), estado, sub, appr, appr_by, rej)
+        for legajo, periodo, estado, sub, appr, appr_by, rej in updates
+    ]
+    if not rows:
+        return
     backend = get_db_backend(secrets)
 
     with get_conn(secrets) as (_, conn):
         if backend == "sqlite":
-            conn.execute(
+            conn.executemany(
                 """
                 UPDATE partes
                 SET estado = ?,
@@ -394,26 +670,47 @@ def update_parte_estado(
                     rejection_comment = ?
                 WHERE legajo = ? AND periodo_yyyymm = ?
                 """,
-                (nuevo_estado, submitted_at, approved_at, approved_by_legajo, rejection_comment, legajo, periodo_yyyymm),
+                [(*r[2:], r[0], r[1]) for r in rows],
             )
             return
 
+        # UPDATE ... FROM (VALUES ...): N partes en un round-trip
         cur = conn.cursor()
-        cur.execute(
+        psycopg2.extras.execute_values(
+            cur,
             """
             UPDATE partes SET
-                estado = %s,
-                submitted_at = COALESCE(%s, submitted_at),
-                approved_at = COALESCE(%s, approved_at),
-                approved_by_legajo = COALESCE(%s, approved_by_legajo),
-                rejection_comment = %s
-            WHERE legajo = %s AND periodo_yyyymm = %s
+                estado = v.estado,
+                submitted_at = COALESCE(v.submitted_at, partes.submitted_at),
+                approved_at = COALESCE(v.approved_at, partes.approved_at),
+                approved_by_legajo = COALESCE(v.approved_by_legajo, partes.approved_by_legajo),
+                rejection_comment = v.rejection_comment
+            FROM (VALUES %s) AS v(legajo, periodo_yyyymm, estado, submitted_at, approved_at, approved_by_legajo, rejection_comment)
+            WHERE partes.legajo = v.legajo AND partes.periodo_yyyymm = v.periodo_yyyymm
             """,
-            (nuevo_estado, submitted_at, approved_at, approved_by_legajo, rejection_comment, legajo, periodo_yyyymm),
+            rows,
+            template="(%s, %s, %s, %s::text, %s::text, %s::text, %s::text)",
+            page_size=max(len(rows), 1),
         )
         cur.close()
 
 
+def update_parte_estado(
+    secrets,
+    legajo: str,
+    periodo_yyyymm: str,
+    nuevo_estado: str,
+    submitted_at: Optional[str] = None,
+    approved_at: Optional[str] = None,
+    approved_by_legajo: Optional[str] = None,
+    rejection_comment: Optional[str] = None,
+) -> None:
+    bulk_update_parte_estado(
+        secrets,
+        [(legajo, periodo_yyyymm, nuevo_estado, submitted_at, approved_at, approved_by_legajo, rejection_comment)],
+    )
+
+
 def list_pendientes_para_lider(secrets, leader_legajo: str) -> List[Dict[str, Any]]:
     leader_legajo = str(leader_legajo).strip()
     backend = get_db_backend(secrets)
@@ -456,7 +753,7 @@ def get_parte(secrets, legajo: str, periodo_yyyymm: str) -> Optional[Dict[str, A
     with get_conn(secrets) as (_, conn):
         if backend == "sqlite":
             cur = conn.execute(
-                "SELECT * FROM partes WHERE legajo=? AND periodo_yyyymm=?",
+                f"SELECT {PARTE_COLS} FROM partes WHERE legajo=? AND periodo_yyyymm=?",
                 (legajo, periodo_yyyymm),
             )
             r = cur.fetchone()
@@ -464,7 +761,7 @@ def get_parte(secrets, legajo: str, periodo_yyyymm: str) -> Optional[Dict[str, A
 
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cur.execute(
-            "SELECT * FROM partes WHERE legajo=%s AND periodo_yyyymm=%s",
+            f"SELECT {PARTE_COLS} FROM partes WHERE legajo=%s AND periodo_yyyymm=%s",
             (legajo, periodo_yyyymm),
         )
         r = cur.fetchone()
@@ -474,6 +771,35 @@ def get_parte(secrets, legajo: str, periodo_yyyymm: str) -> Optional[Dict[str, A
 
 # ---------- Items ----------
 
+def _fecha_to_int(fecha_iso: str) -> int:
+    # SQLite guarda fecha como INTEGER YYYYMMDD
+    return int(str(fecha_iso).replace("-", ""))
+
+
+def _int_to_fecha(v: int) -> str:
+    return f"{v // 10000:04d}-{v // 100 % 100:02d}-{v % 100:02d}"
+
+
+_ITEMS_DELETE_PG = "DELETE FROM items WHERE legajo=%s AND fecha = ANY(%s::date[])"
+
+
+def _delete_items_conn(backend: str, conn, legajo: str, fechas_iso: List[str]) -> None:
+    if not fechas_iso:
+        return
+    if backend == "sqlite":
+        _sqlite_begin_immediate(conn)
+        q_marks = ",".join(["?"] * len(fechas_iso))
+        conn.execute(
+            f"DELETE FROM items WHERE legajo = ? AND fecha IN ({q_marks})",
+            (legajo, *map(_fecha_to_int, fechas_iso)),
+        )
+        return
+
+    cur = conn.cursor()
+    cur.execute(_ITEMS_DELETE_PG, (legajo, list(fechas_iso)))
+    cur.close()
+
+
 def delete_items_for_dates(secrets, legajo: str, fechas_iso: List[str]) -> None:
     if not fechas_iso:
         return
@@ -481,72 +807,99 @@ def delete_items_for_dates(secrets, legajo: str, fechas_iso: List[str]) -> None:
     backend = get_db_backend(secrets)
 
     with get_conn(secrets) as (_, conn):
-        if backend == "sqlite":
-            q_marks = ",".join(["?"] * len(fechas_iso))
-            conn.execute(
-                f"DELETE FROM items WHERE legajo = ? AND fecha IN ({q_marks})",
-                (legajo, *fechas_iso),
-            )
-            return
+        _delete_items_conn(backend, conn, legajo, fechas_iso)
 
-        cur = conn.cursor()
-        cur.execute(
-            "DELETE FROM items WHERE legajo=%s AND fecha = ANY(%s)",
-            (legajo, fechas_iso),
+
+# Fila de items en el orden de INSERT: (legajo, fecha, tipo, valor_text, valor_num, comentario).
+# El caller entrega los valores ya normalizados (strings sin espacios, fecha ISO, None para vacíos).
+ItemRow = Tuple[str, str, str, Optional[str], Optional[float], Optional[str]]
+
+
+ITEMS_COPY_MIN_ROWS = 200
+
+_ITEMS_UNNEST_INSERT = """
+    INSERT INTO items (legajo, fecha, tipo, valor_text, valor_num, comentario)
+    SELECT * FROM unnest(%s::text[], %s::date[], %s::text[], %s::text[], %s::float8[], %s::text[])
+"""
+
+
+def _item_arrays(rows: List[ItemRow]) -> Tuple[List[Any], ...]:
+    # Filas -> un array por columna (parámetros de unnest)
+    return tuple(list(c) for c in zip(*rows))
+
+
+def _insert_items_conn(backend: str, conn, rows: List[ItemRow]) -> None:
+    if not rows:
+        return
+    if backend == "sqlite":
+        _sqlite_begin_immediate(conn)
+        conn.executemany(
+            """
+            INSERT INTO items (legajo, fecha, tipo, valor_text, valor_num, comentario)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [(r[0], _fecha_to_int(r[1]), *r[2:]) for r in rows],
         )
-        cur.close()
+        return
+
+    cur = conn.cursor()
+    if len(rows) >= ITEMS_COPY_MIN_ROWS:
+        # Cargas grandes: COPY evita el parse/plan por fila
+        cur.copy_expert(
+            "COPY items (legajo, fecha, tipo, valor_text, valor_num, comentario) FROM STDIN",
+            _CopyStream(rows),
+        )
+    else:
+        # Un solo statement: cada columna viaja como array y unnest las arma en filas
+        cur.execute(_ITEMS_UNNEST_INSERT, _item_arrays(rows))
+    cur.close()
 
 
-def insert_items(secrets, items: List[Dict[str, Any]]) -> None:
-    if not items:
+def insert_items(secrets, rows: List[ItemRow]) -> None:
+    if not rows:
         return
     backend = get_db_backend(secrets)
 
     with get_conn(secrets) as (_, conn):
-        if backend == "sqlite":
-            conn.executemany(
-                """
-                INSERT INTO items (legajo, fecha, tipo, valor_text, valor_num, comentario)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                [
-                    (
-                        str(it["legajo"]).strip(),
-                        str(it["fecha"]).strip(),
-                        str(it["tipo"]).strip(),
-                        it.get("valor_text"),
-                        it.get("valor_num"),
-                        it.get("comentario"),
-                    )
-                    for it in items
-                ],
+        _insert_items_conn(backend, conn, rows)
+
+
+def replace_items_for_period(secrets, legajo: str, fechas_iso: List[str], rows: List[ItemRow]) -> None:
+    """
+    Reemplaza los items de un legajo para las fechas dadas (DELETE + INSERT)
+    en una sola conexión/transacción. rows: tuplas ItemRow ya normalizadas.
+    """
+    legajo = str(legajo).strip()
+    backend = get_db_backend(secrets)
+
+    with get_conn(secrets) as (_, conn):
+        if backend == "postgres" and fechas_iso and 0 < len(rows) < ITEMS_COPY_MIN_ROWS:
+            # DELETE + INSERT unnest en un solo envío al servidor (un round-trip)
+            cur = conn.cursor()
+            cur.execute(
+                _ITEMS_DELETE_PG + ";" + _ITEMS_UNNEST_INSERT,
+                (legajo, list(fechas_iso), *_item_arrays(rows)),
             )
+            cur.close()
             return
 
-        cur = conn.cursor()
-        psycopg2.extras.execute_batch(
-            cur,
-            """
-            INSERT INTO items (legajo, fecha, tipo, valor_text, valor_num, comentario)
-            VALUES (%s,%s,%s,%s,%s,%s)
-            """,
-            [
-                (
-                    str(it["legajo"]).strip(),
-                    str(it["fecha"]).strip(),
-                    str(it["tipo"]).strip(),
-                    it.get("valor_text"),
-                    it.get("valor_num"),
-                    it.get("comentario"),
-                )
-                for it in items
-            ],
-            page_size=500,
-        )
-        cur.close()
+        _delete_items_conn(backend, conn, legajo, fechas_iso)
+        _insert_items_conn(backend, conn, rows)
+
 
+ITEM_LIST_COLS = ("fecha", "tipo", "valor_num", "comentario")
 
-def list_items_for_period(secrets, legajo: str, fecha_desde_iso: str, fecha_hasta_iso: str) -> List[Dict[str, Any]]:
+# Rangos de más de ~un trimestre se leen con cursor server-side en Postgres
+ITEMS_STREAM_MIN_DAYS = 92
+ITEMS_STREAM_ITERSIZE = 5000
+
+
+def list_items_for_period(secrets, legajo: str, fecha_desde_iso: str, fecha_hasta_iso: str) -> Dict[str, List[Any]]:
+    """
+    Devuelve los items del período en formato columnar:
+    {"fecha": [...], "tipo": [...], "valor_num": [...], "comentario": [...]}
+    ordenados por fecha, tipo.
+    """
     legajo = str(legajo).strip()
     backend = get_db_backend(secrets)
 
@@ -554,23 +907,41 @@ def list_items_for_period(secrets, legajo: str, fecha_desde_iso: str, fecha_hast
         if backend == "sqlite":
             cur = conn.execute(
                 """
-                SELECT * FROM items
+                SELECT fecha, tipo, valor_num, comentario FROM items
                 WHERE legajo = ? AND fecha >= ? AND fecha <= ?
                 ORDER BY fecha, tipo
                 """,
-                (legajo, fecha_desde_iso, fecha_hasta_iso),
+                (legajo, _fecha_to_int(fecha_desde_iso), _fecha_to_int(fecha_hasta_iso)),
             )
-            return [dict(r) for r in cur.fetchall()]
+            cols = _as_columns(ITEM_LIST_COLS, cur.fetchall())
+            cols["fecha"] = [_int_to_fecha(f) for f in cols["fecha"]]
+            return cols
 
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(
-            """
-            SELECT * FROM items
+        sql = """
+            SELECT fecha, tipo, valor_num, comentario FROM items
             WHERE legajo=%s AND fecha >= %s AND fecha <= %s
             ORDER BY fecha, tipo
-            """,
-            (legajo, fecha_desde_iso, fecha_hasta_iso),
-        )
-        rows = cur.fetchall()
+        """
+        params = (legajo, fecha_desde_iso, fecha_hasta_iso)
+        dias = (date.fromisoformat(fecha_hasta_iso) - date.fromisoformat(fecha_desde_iso)).days
+
+        if dias <= ITEMS_STREAM_MIN_DAYS:
+            # Un mes / trimestre: fetchall directo
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            cols = _as_columns(ITEM_LIST_COLS, cur.fetchall())
+        else:
+            # Rangos largos (p. ej. export anual): cursor server-side, por lotes,
+            # sin tener todo el resultado en el buffer de libpq a la vez
+            cur = conn.cursor(name="items_stream")
+            cur.execute(sql, params)
+            cols = {c: [] for c in ITEM_LIST_COLS}
+            while True:
+                chunk = cur.fetchmany(ITEMS_STREAM_ITERSIZE)
+                if not chunk:
+                    break
+                for c, v in _as_columns(ITEM_LIST_COLS, chunk).items():
+                    cols[c].extend(v)
         cur.close()
-        return rows
+        cols["fecha"] = [f.isoformat() for f in cols["fecha"]]
+        return cols
@@ -1,16 +1,22 @@
 import io
-import json
 from typing import Any, Dict, List, Optional, Tuple
 
+import orjson
 import pandas as pd
+import xlsxwriter
+from python_calamine import CalamineWorkbook
 
 
-def _col(df: pd.DataFrame, *candidates: str) -> Optional[str]:
+def _col_index(df: pd.DataFrame) -> Dict[str, str]:
+    """Mapa nombre normalizado (strip + lower) -> nombre real de columna."""
+    return {str(c).strip().lower(): c for c in df.columns}
+
+
+def _col(norm: Dict[str, str], *candidates: str) -> Optional[str]:
     """
     Devuelve el nombre real de columna por match case-insensitive y sin espacios.
-    Acepta múltiples candidatos (alias).
+    Acepta múltiples candidatos (alias). `norm` es el resultado de _col_index.
     """
-    norm = {str(c).strip().lower(): c for c in df.columns}
     for cand in candidates:
         key = str(cand).strip().lower()
         if key in norm:
@@ -43,25 +49,86 @@ def _norm_legajo(x) -> str:
     return s
 
 
-def import_maestro_general(excel_bytes: bytes) -> Tuple[List[Dict[str, Any]], List[str]]:
-    warnings: List[str] = []
-    xls = pd.ExcelFile(io.BytesIO(excel_bytes))
+def _str_col(s: pd.Series) -> pd.Series:
+    """Texto recortado por celda; NaN/None -> ""."""
+    return s.where(s.notna(), "").astype(str).str.strip().astype(object)
+
+
+def _opt_str_col(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    """Como _str_col pero NaN/None (o columna ausente) -> None."""
+    if not col:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    s = df[col]
+    return _str_col(s).where(s.notna(), None)
+
+
+def _cell(v: Any) -> Any:
+    """
+    Normaliza un valor leído por calamine: celda vacía ("") -> None y números
+    enteros que llegan como float (5474.0) -> int, como hace pandas.
+    Sólo dentro de 2**53 (enteros exactos en un double): un CBU de 22 dígitos
+    queda float en vez de convertirse en un int con dígitos inventados.
+    """
+    if isinstance(v, str):
+        return v if v != "" else None
+    if isinstance(v, float) and v.is_integer() and abs(v) < 2**53:
+        return int(v)
+    return v
+
+
+def _extra_to_json(extra: Dict[str, Any]) -> str:
+    # PASSTHROUGH_DATETIME: fechas vía default=str, mismo formato que json.dumps
+    return orjson.dumps(extra, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+
+
+def _dedup_columns(names: List[str]) -> List[str]:
+    """Encabezados repetidos -> 'Obs', 'Obs.1', 'Obs.2'... (como los renombraba pd.read_excel)."""
+    counts: Dict[str, int] = {}
+    out: List[str] = []
+    for name in names:
+        cur = counts.get(name, 0)
+        while cur > 0:
+            counts[name] = cur + 1
+            name = f"{name}.{cur}"
+            cur = counts.get(name, 0)
+        out.append(name)
+        counts[name] = cur + 1
+    return out
+
+
+def _read_general_sheet(excel_bytes: bytes) -> pd.DataFrame:
+    """
+    Lee la pestaña 'General' (match case-insensitive) con python-calamine
+    (parser en Rust; xlsx/xls/ods), una sola pasada sobre el archivo.
+    Los valores quedan como objetos Python (sin inferir dtypes).
+    """
+    wb = CalamineWorkbook.from_filelike(io.BytesIO(excel_bytes))
 
     sheet_name = None
-    for s in xls.sheet_names:
+    for s in wb.sheet_names:
         if str(s).strip().lower() == "general":
             sheet_name = s
             break
     if sheet_name is None:
         raise ValueError("No se encontró la pestaña 'General' en el Excel.")
 
-    df = pd.read_excel(xls, sheet_name=sheet_name)
-    df.columns = [str(c).strip() for c in df.columns]
+    data = wb.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)
+    if not data:
+        return pd.DataFrame()
+    header, body = data[0], data[1:]
+    columns = _dedup_columns([f"Unnamed: {i}" if c in (None, "") else str(c).strip() for i, c in enumerate(header)])
+    return pd.DataFrame([[_cell(v) for v in r] for r in body], columns=columns, dtype=object)
+
+
+def import_maestro_general(excel_bytes: bytes) -> Tuple[List[Dict[str, Any]], List[str]]:
+    warnings: List[str] = []
+    df = _read_general_sheet(excel_bytes)
+    norm = _col_index(df)
 
-    c_legajo = _col(df, "Legajo", "Legajo Clear", "LegajoClear")
-    c_cuil = _col(df, "CUIL")
-    c_nombre = _col(df, "Nombre y Apellido", "Nombre", "Apellido y Nombre")
-    c_leader = _col(df, "leader_legajo", "Lider", "Líder", "Jefe", "leader")
+    c_legajo = _col(norm, "Legajo", "Legajo Clear", "LegajoClear")
+    c_cuil = _col(norm, "CUIL")
+    c_nombre = _col(norm, "Nombre y Apellido", "Nombre", "Apellido y Nombre")
+    c_leader = _col(norm, "leader_legajo", "Lider", "Líder", "Jefe", "leader")
 
     if not c_legajo or not c_cuil or not c_nombre or not c_leader:
         missing = []
@@ -75,45 +142,52 @@ def import_maestro_general(excel_bytes: bytes) -> Tuple[List[Dict[str, Any]], Li
             missing.append("leader_legajo (o Lider/Líder/Jefe)")
         raise ValueError("Faltan columnas requeridas en 'General': " + ", ".join(missing))
 
-    c_funcion = _col(df, "FUNCIÓN", "Función", "Funcion")
-    c_origen = _col(df, "Origen")
-    c_lugar = _col(df, "Lugar de trabajo", "Lugar de Trabajo", "LugarTrabajo", "Lugar")
-
-    rows: List[Dict[str, Any]] = []
-    for _, r in df.iterrows():
-        legajo = _norm_legajo(r[c_legajo])
-        if not legajo:
-            continue
-
-        # CUIL lo dejamos como string "tal cual" (sin normalizar a int)
-        cuil = str(r[c_cuil]).strip() if pd.notna(r[c_cuil]) else ""
-        nombre = str(r[c_nombre]).strip() if pd.notna(r[c_nombre]) else ""
-        leader_legajo = _norm_legajo(r[c_leader])
-
-        if not cuil or not nombre or not leader_legajo:
-            warnings.append(f"Legajo {legajo}: faltan datos (CUIL/NOMBRE/LÍDER).")
-
-        extra: Dict[str, Any] = {}
-        for col in df.columns:
-            if col in {c_legajo, c_cuil, c_nombre, c_leader, c_funcion, c_origen, c_lugar}:
-                continue
-            val = r[col]
-            if pd.notna(val):
-                extra[str(col)] = val
-
-        rows.append(
-            {
-                "legajo": legajo,
-                "cuil": cuil,
-                "nombre": nombre,
-                "leader_legajo": leader_legajo,
-                "funcion": str(r[c_funcion]).strip() if c_funcion and pd.notna(r[c_funcion]) else None,
-                "origen": str(r[c_origen]).strip() if c_origen and pd.notna(r[c_origen]) else None,
-                "lugar_trabajo": str(r[c_lugar]).strip() if c_lugar and pd.notna(r[c_lugar]) else None,
-                "extra_json": json.dumps(extra, default=str, ensure_ascii=False) if extra else None,
-            }
+    c_funcion = _col(norm, "FUNCIÓN", "Función", "Funcion")
+    c_origen = _col(norm, "Origen")
+    c_lugar = _col(norm, "Lugar de trabajo", "Lugar de Trabajo", "LugarTrabajo", "Lugar")
+
+    core_cols = {c_legajo, c_cuil, c_nombre, c_leader, c_funcion, c_origen, c_lugar}
+    extra_cols = [c for c in df.columns if c not in core_cols]
+
+    legajo = df[c_legajo].map(_norm_legajo)
+    df = df.loc[legajo.ne("")]
+    legajo = legajo.loc[df.index]
+
+    # CUIL lo dejamos como string "tal cual" (sin normalizar a int)
+    cuil = _str_col(df[c_cuil])
+    nombre = _str_col(df[c_nombre])
+    leader_legajo = df[c_leader].map(_norm_legajo)
+
+    missing = cuil.eq("") | nombre.eq("") | leader_legajo.eq("")
+    warnings.extend(f"Legajo {l}: faltan datos (CUIL/NOMBRE/LÍDER)." for l in legajo.loc[missing])
+
+    if extra_cols:
+        # NaN -> None una sola vez; por fila solo se zipean las claves precalculadas
+        # (tomadas del mismo frame que se itera, para que columnas y claves coincidan)
+        extra_df = df[extra_cols].astype(object)
+        extra_df = extra_df.where(extra_df.notna(), None)
+        extra_keys = [str(c) for c in extra_df.columns]
+        extras = (
+            {k: v for k, v in zip(extra_keys, vals) if v is not None}
+            for vals in extra_df.itertuples(index=False, name=None)
         )
-
+        extra_json = [_extra_to_json(e) if e else None for e in extras]
+    else:
+        extra_json = [None] * len(df)
+
+    out = pd.DataFrame(
+        {
+            "legajo": legajo,
+            "cuil": cuil,
+            "nombre": nombre,
+            "leader_legajo": leader_legajo,
+            "funcion": _opt_str_col(df, c_funcion),
+            "origen": _opt_str_col(df, c_origen),
+            "lugar_trabajo": _opt_str_col(df, c_lugar),
+            "extra_json": pd.Series(extra_json, index=df.index, dtype=object),
+        }
+    )
+    rows: List[Dict[str, Any]] = out.to_dict(orient="records")
     return rows, warnings
 
 
@@ -124,41 +198,46 @@ def export_parte_to_excel(
     df_mes: pd.DataFrame,
     totales: Dict[str, Any],
 ) -> bytes:
+    """
+    Arma el xlsx con xlsxwriter en modo constant_memory: cada fila se vuelca
+    apenas se pasa a la siguiente, así que se escribe estrictamente fila a fila
+    (pandas.to_excel escribe por columnas y no sirve en este modo).
+    """
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        detalle = df_mes.copy()
-        detalle.insert(0, "Legajo", legajo)
-        detalle.insert(1, "Empleado", person_nombre)
-        detalle.insert(2, "Periodo", periodo_yyyymm)
-
-        detalle.to_excel(writer, index=False, sheet_name="Detalle")
-
-        resumen = pd.DataFrame(
-            [
-                {"Métrica": "Días Guardia (G)", "Valor": totales.get("G", 0)},
-                {"Métrica": "Días Franco (F)", "Valor": totales.get("F", 0)},
-                {"Métrica": "Días Desarraigo (D)", "Valor": totales.get("D", 0)},
-                {"Métrica": "Días HomeOffice (HO)", "Valor": totales.get("HO", 0)},
-                {"Métrica": "Total Hs Viaje (HV)", "Valor": totales.get("HV", 0.0)},
-                {"Métrica": "Total Hs Extra (HE)", "Valor": totales.get("HE", 0.0)},
-            ]
-        )
-        resumen.to_excel(writer, index=False, sheet_name="Resumen")
-
-        workbook = writer.book
-        fmt_header = workbook.add_format({"bold": True})
-        for sheet in ["Detalle", "Resumen"]:
-            ws = writer.sheets[sheet]
-            ws.set_row(0, None, fmt_header)
-            ws.freeze_panes(1, 0)
-
-        ws = writer.sheets["Detalle"]
-        ws.set_column(0, 0, 10)
-        ws.set_column(1, 1, 28)
-        ws.set_column(2, 2, 10)
-        ws.set_column(3, 3, 12)
-        ws.set_column(4, 7, 6)
-        ws.set_column(8, 9, 10)
-        ws.set_column(10, 10, 30)
-
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    fmt_header = workbook.add_format({"bold": True})
+
+    # Detalle
+    ws = workbook.add_worksheet("Detalle")
+    ws.freeze_panes(1, 0)
+    ws.set_column(0, 0, 10)
+    ws.set_column(1, 1, 28)
+    ws.set_column(2, 2, 10)
+    ws.set_column(3, 3, 12)
+    ws.set_column(4, 7, 6)
+    ws.set_column(8, 9, 10)
+    ws.set_column(10, 10, 30)
+    ws.write_row(0, 0, ["Legajo", "Empleado", "Periodo", *map(str, df_mes.columns)], fmt_header)
+
+    prefijo = (legajo, person_nombre, periodo_yyyymm)
+    valores = df_mes.astype(object).where(df_mes.notna(), None)
+    for i, row in enumerate(valores.itertuples(index=False, name=None), start=1):
+        ws.write_row(i, 0, prefijo + row)
+
+    # Resumen
+    ws = workbook.add_worksheet("Resumen")
+    ws.freeze_panes(1, 0)
+    ws.write_row(0, 0, ["Métrica", "Valor"], fmt_header)
+    resumen = [
+        ("Días Guardia (G)", totales.get("G", 0)),
+        ("Días Franco (F)", totales.get("F", 0)),
+        ("Días Desarraigo (D)", totales.get("D", 0)),
+        ("Días HomeOffice (HO)", totales.get("HO", 0)),
+        ("Total Hs Viaje (HV)", totales.get("HV", 0.0)),
+        ("Total Hs Extra (HE)", totales.get("HE", 0.0)),
+    ]
+    for i, row in enumerate(resumen, start=1):
+        ws.write_row(i, 0, row)
+
+    workbook.close()
     return output.getvalue()
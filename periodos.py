@@ -0,0 +1,24 @@
+import calendar
+from datetime import date
+from functools import lru_cache
+from typing import Tuple
+
+# Módulo importado (no el script principal de Streamlit, que se re-ejecuta en un
+# módulo nuevo en cada rerun): los lru_cache sobreviven entre reruns.
+
+
+@lru_cache(maxsize=64)
+def month_bounds(y: int, m: int) -> Tuple[date, date]:
+    last_day = calendar.monthrange(y, m)[1]
+    return date(y, m, 1), date(y, m, last_day)
+
+
+@lru_cache(maxsize=64)
+def month_dates(y: int, m: int) -> Tuple[date, ...]:
+    start, end = month_bounds(y, m)
+    return tuple(date(y, m, d) for d in range(1, end.day + 1))
+
+
+@lru_cache(maxsize=64)
+def month_dates_iso(y: int, m: int) -> Tuple[str, ...]:
+    return tuple(d.isoformat() for d in month_dates(y, m))